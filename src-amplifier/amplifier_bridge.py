@@ -9,22 +9,54 @@ from the VSCode extension via stdin/stdout communication.
 Based on amplifier-foundation examples 08 (CLI app) and 14 (session persistence).
 """
 import asyncio
+import atexit
+import hashlib
+import inspect
 import json
 import logging
+import logging.handlers
 import os
+import queue
+import sqlite3
+import stat
 import sys
+import threading
+import time
+from contextlib import closing
+from contextvars import ContextVar
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, AsyncIterator
+from typing import Any, AsyncIterator, Awaitable, BinaryIO, Callable
 
 from amplifier_foundation import load_bundle
 from amplifier_core import AmplifierSession
 
+try:
+    import orjson
+except ImportError:  # Optional: faster JSON on the per-chunk hot path
+    orjson = None
+
 
 # =============================================================================
 # Configuration
 # =============================================================================
 
+# Buffered protocol output is written once it reaches this many bytes, or
+# after this many seconds, whichever comes first
+OUTPUT_FLUSH_BYTES = 16 * 1024
+OUTPUT_FLUSH_INTERVAL = 0.016
+
+# Incoming messages larger than this are discarded with an error, and
+# prompts longer than this many characters are rejected before execution
+MAX_MESSAGE_BYTES = 8 * 1024 * 1024
+MAX_PROMPT_CHARS = 2 * 1024 * 1024
+
+# Prepared bundles keyed by (resolved bundle path, mtime_ns). Preparing may
+# download modules, so re-initializing with an unchanged bundle reuses it.
+_PREPARED_CACHE: dict[tuple[str, int], Any] = {}
+_PREPARED_LOCK = asyncio.Lock()
+
+
 @dataclass
 class BridgeConfig:
     """Bridge service configuration."""
@@ -35,6 +67,13 @@ class BridgeConfig:
     # Bundle configuration
     bundle_path: str | None = None
     
+    # Conversation history is saved here per workspace (None disables)
+    sessions_dir: Path | None = None
+    
+    # Protocol framing: newline-delimited JSON unless the client opts in
+    # to length-prefixed frames
+    length_prefixed: bool = False
+    
     # Logging
     log_level: str = "WARNING"  # Keep quiet for VSCode
     log_file: Path | None = None
@@ -43,7 +82,13 @@ class BridgeConfig:
     def from_env(cls) -> "BridgeConfig":
         """Load configuration from environment."""
         log_file = os.getenv("AMPLIFIER_BRIDGE_LOG")
+        sessions_dir = os.getenv(
+            "AMPLIFIER_SESSIONS_DIR", str(Path.home() / ".amplifier" / "sessions")
+        )
         return cls(
+            bundle_path=os.getenv("AMPLIFIER_BUNDLE_PATH") or None,
+            sessions_dir=Path(sessions_dir) if sessions_dir else None,
+            length_prefixed=os.getenv("AMPLIFIER_BRIDGE_FRAMING") == "length",
             log_level=os.getenv("AMPLIFIER_LOG_LEVEL", "WARNING"),
             log_file=Path(log_file) if log_file else None,
         )
@@ -53,6 +98,19 @@ class BridgeConfig:
 # Bridge Service
 # =============================================================================
 
+# Identifies the command being handled; tasks started for a command (like a
+# running prompt) inherit it, so their log lines carry the same id
+REQUEST_ID: ContextVar[str] = ContextVar("request_id", default="-")
+
+
+class RequestContextFilter(logging.Filter):
+    """Add the current request id to log records as %(req)s."""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.req = REQUEST_ID.get()
+        return True
+
+
 class VSCodeAmplifierBridge:
     """Bridge service for VSCode extension.
     
@@ -60,6 +118,7 @@ class VSCodeAmplifierBridge:
     - Session initialization with workspace context
     - Multiple prompt executions on the same session
     - Streaming responses back to VSCode
+    - Cancelling a running prompt
     - Graceful shutdown
     """
     
@@ -67,26 +126,76 @@ class VSCodeAmplifierBridge:
         self.config = config
         self.session = None
         self.workspace_root = None
+        self._log_listener: logging.handlers.QueueListener | None = None
         self.logger = self._setup_logging()
+        self._current_task: asyncio.Task | None = None
+        self._preheat_task: asyncio.Task | None = None
+        
+        # Event loop the bridge runs on (set by main; otherwise looked up)
+        self.loop: asyncio.AbstractEventLoop | None = None
     
     def _setup_logging(self) -> logging.Logger:
         """Configure logging."""
         logger = logging.getLogger("amplifier_bridge")
         logger.setLevel(getattr(logging, self.config.log_level))
         
-        # Log to file if specified, otherwise stderr (won't interfere with stdout)
+        # Log to file if specified, otherwise stderr (won't interfere with stdout).
+        # Timestamps only go to the file: the extension host stamps stderr
+        # lines itself, so formatting asctime there is wasted work.
         if self.config.log_file:
-            handler = logging.FileHandler(self.config.log_file)
+            file_handler = logging.FileHandler(self.config.log_file)
+            file_handler.setFormatter(
+                logging.Formatter("%(asctime)s [%(levelname)s] %(req)s %(name)s: %(message)s")
+            )
+            
+            # Disk writes happen on a listener thread so a slow disk can't
+            # stall the event loop; logging calls just enqueue the record
+            log_queue: queue.SimpleQueue = queue.SimpleQueue()
+            handler = logging.handlers.QueueHandler(log_queue)
+            self._log_listener = logging.handlers.QueueListener(
+                log_queue, file_handler, respect_handler_level=True
+            )
+            self._log_listener.start()
+            atexit.register(self._stop_log_listener)
         else:
             handler = logging.StreamHandler(sys.stderr)
+            handler.setFormatter(logging.Formatter("[%(levelname)s] %(req)s %(name)s: %(message)s"))
         
-        handler.setFormatter(
-            logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
-        )
+        # Filter where records are created, not on the listener thread,
+        # so the request context is still visible
+        handler.addFilter(RequestContextFilter())
         logger.addHandler(handler)
         
         return logger
     
+    def _stop_log_listener(self) -> None:
+        """Write out queued log records and stop the listener thread."""
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            self._log_listener = None
+    
+    def preheat(self) -> None:
+        """Start preparing the configured bundle before initialize arrives.
+        
+        Preparing may download modules; overlapping it with VSCode startup
+        means the first prompt doesn't wait for it. initialize() picks up
+        the result through the prepared-bundle cache.
+        """
+        if self.config.bundle_path and self._preheat_task is None:
+            loop = self.loop or asyncio.get_running_loop()
+            self._preheat_task = loop.create_task(
+                self._eager_prepare(Path(self.config.bundle_path))
+            )
+    
+    async def _eager_prepare(self, bundle_file: Path) -> None:
+        """Prepare a bundle in the background, logging rather than raising."""
+        try:
+            await self._get_prepared_bundle(bundle_file)
+            self.logger.info(f"Preheated bundle: {bundle_file}")
+        except Exception as e:
+            # initialize() will retry and report the error
+            self.logger.warning(f"Bundle preheat failed: {e}")
+    
     async def initialize(self, workspace_root: str, bundle_path: str | None = None) -> dict[str, Any]:
         """Initialize Amplifier session.
         
@@ -98,13 +207,12 @@ class VSCodeAmplifierBridge:
             Status response
         """
         self.logger.info(f"Initializing bridge with workspace: {workspace_root}")
-        self.workspace_root = workspace_root
         
         try:
             # Use provided bundle path or default
             if bundle_path:
                 self.config.bundle_path = bundle_path
-            print(bundle_path)
+            self.logger.debug(f"Bundle path: {self.config.bundle_path}")
             
             if not self.config.bundle_path:
                 return {
@@ -119,23 +227,23 @@ class VSCodeAmplifierBridge:
                     "error": f"Bundle file not found: {bundle_file}"
                 }
             
-            self.logger.info(f"Loading bundle from: {bundle_file}")
-            
-            # Load the bundle configuration
-            bundle = await load_bundle(str(bundle_file))
-            
-            # Prepare (download modules if needed)
-            self.logger.info("Preparing bundle (may download modules)...")
-            prepared = await bundle.prepare()
+            # Waits for a preheat of the same bundle instead of repeating it
+            prepared = await self._get_prepared_bundle(bundle_file)
             
-            # Create persistent session
+            # Create persistent session rooted at the workspace. The process
+            # cwd is left alone (VSCode spawns the bridge in the workspace).
             self.logger.info("Creating session...")
-            self.session = await prepared.create_session()
+            session_kwargs = {}
+            if workspace_root and "session_cwd" in inspect.signature(prepared.create_session).parameters:
+                session_kwargs["session_cwd"] = Path(workspace_root)
+            self.session = await prepared.create_session(**session_kwargs)
+            
+            # Only now: a failed re-initialize keeps the old session, whose
+            # history must keep going to its own workspace
+            self.workspace_root = workspace_root
             
-            # Change to workspace directory
-            if workspace_root:
-                os.chdir(workspace_root)
-                self.logger.info(f"Changed working directory to: {workspace_root}")
+            # Warm-start from the last session saved for this workspace
+            await self._restore_history()
             
             self.logger.info("Session initialized successfully")
             return {
@@ -151,6 +259,36 @@ class VSCodeAmplifierBridge:
                 "error": str(e)
             }
     
+    async def _get_prepared_bundle(self, bundle_file: Path) -> Any:
+        """Load and prepare a bundle, reusing a cached result if unchanged.
+        
+        Args:
+            bundle_file: Path to the bundle YAML file
+            
+        Returns:
+            The prepared bundle
+        """
+        key = (str(bundle_file.resolve()), bundle_file.stat().st_mtime_ns)
+        
+        # Serialize so concurrent initializes don't download twice
+        async with _PREPARED_LOCK:
+            prepared = _PREPARED_CACHE.get(key)
+            if prepared is not None:
+                self.logger.info(f"Reusing prepared bundle: {bundle_file}")
+                return prepared
+            
+            self.logger.info(f"Loading bundle from: {bundle_file}")
+            
+            # Load the bundle configuration
+            bundle = await load_bundle(str(bundle_file))
+            
+            # Prepare (download modules if needed)
+            self.logger.info("Preparing bundle (may download modules)...")
+            prepared = await bundle.prepare()
+            
+            _PREPARED_CACHE[key] = prepared
+            return prepared
+    
     async def execute_prompt(self, prompt: str) -> AsyncIterator[dict[str, Any]]:
         """Execute prompt on the persistent session.
         
@@ -167,22 +305,44 @@ class VSCodeAmplifierBridge:
             }
             return
         
+        if not isinstance(prompt, str):
+            yield {"type": "error", "error": "Prompt must be a string"}
+            return
+        
+        if len(prompt) > MAX_PROMPT_CHARS:
+            yield {
+                "type": "error",
+                "error": f"Prompt too long: {len(prompt)} characters (limit {MAX_PROMPT_CHARS})"
+            }
+            return
+        
         try:
-            self.logger.info(f"Executing prompt: {prompt[:100]}...")
+            # Skip building the message at the default WARNING level
+            if self.logger.isEnabledFor(logging.INFO):
+                self.logger.info(f"Executing prompt: {prompt[:100]}...")
             
             # Execute on the same session - context is maintained!
             # This is the key: session.execute() maintains conversation history
-            response = await self.session.execute(prompt)
+            stream = self._open_stream(prompt)
             
-            # For now, return the complete response
-            # TODO: Implement true streaming if Amplifier supports it
-            yield {
-                "type": "response",
-                "content": response
-            }
+            if stream is None:
+                # No streaming API - return the complete response
+                response = await self.session.execute(prompt)
+                yield {
+                    "type": "response",
+                    "content": response
+                }
+            else:
+                # Pass pieces on as they arrive; StdioChannel batches the writes
+                async for piece in stream:
+                    if piece:
+                        yield {"type": "chunk", "content": piece}
             
             self.logger.info("Execution completed")
             
+            # Save every turn so a crash or kill doesn't lose the conversation
+            await self.save_history()
+            
         except Exception as e:
             self.logger.error(f"Execution failed: {e}", exc_info=True)
             yield {
@@ -190,6 +350,97 @@ class VSCodeAmplifierBridge:
                 "error": str(e)
             }
     
+    async def start_prompt(self, prompt: str, channel: "StdioChannel") -> None:
+        """Execute a prompt in a background task so it can be cancelled.
+        
+        Args:
+            prompt: User prompt from VSCode
+            channel: Channel the responses are sent on
+        """
+        loop = self.loop or asyncio.get_running_loop()
+        self._current_task = loop.create_task(self._drain_prompt(prompt, channel))
+        
+        # Let the task start, so even an immediate cancel reports "done"
+        await asyncio.sleep(0)
+    
+    async def wait_prompt(self) -> None:
+        """Wait for the running prompt, if any, to finish."""
+        task = self._current_task
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+    
+    async def cancel_prompt(self) -> bool:
+        """Cancel the running prompt, if any.
+        
+        Returns:
+            True if a running prompt was cancelled
+        """
+        task = self._current_task
+        if task is None or task.done():
+            return False
+        
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        return True
+    
+    async def _drain_prompt(self, prompt: str, channel: "StdioChannel") -> None:
+        """Send a prompt's responses, always followed by one completion marker."""
+        try:
+            async for chunk in self.execute_prompt(prompt):
+                if chunk["type"] == "chunk":
+                    await channel.send_chunk(chunk["content"])
+                else:
+                    await channel.send(chunk, flush=False)
+        except asyncio.CancelledError:
+            self.logger.info("Execution cancelled")
+            await channel.send({"type": "cancelled"})
+            raise
+        except Exception as e:
+            # Nobody awaits this task's result, so report the failure here
+            self.logger.error(f"Sending response failed: {e}", exc_info=True)
+            await channel.send({"type": "error", "error": str(e)})
+        finally:
+            # Send completion marker
+            await channel.send_done()
+    
+    def _open_stream(self, prompt: str) -> AsyncIterator[str] | None:
+        """Start a streaming execution if the session supports one.
+        
+        Args:
+            prompt: User prompt from VSCode
+            
+        Returns:
+            Async iterator of text pieces, or None if streaming is unsupported
+        """
+        for name in ("stream", "astream"):
+            method = getattr(self.session, name, None)
+            if callable(method):
+                stream = self._as_stream(method(prompt))
+                if stream is not None:
+                    return stream
+        
+        try:
+            parameters = inspect.signature(self.session.execute).parameters
+        except (TypeError, ValueError):
+            return None
+        if "stream" in parameters:
+            return self._as_stream(self.session.execute(prompt, stream=True))
+        
+        return None
+    
+    @staticmethod
+    def _as_stream(result: Any) -> AsyncIterator[str] | None:
+        """Return a streaming call's result if it is an async iterator.
+        
+        Anything else is discarded, so the caller falls back to execute().
+        """
+        if hasattr(result, "__aiter__"):
+            return result
+        # Not an iterator after all; don't leave the coroutine dangling
+        if inspect.iscoroutine(result):
+            result.close()
+        return None
+    
     async def shutdown(self) -> dict[str, Any]:
         """Gracefully shutdown the session.
         
@@ -198,14 +449,334 @@ class VSCodeAmplifierBridge:
         """
         self.logger.info("Shutting down bridge...")
         
+        await self.cancel_prompt()
+        
         if self.session:
+            await self.save_history()
+            
             try:
                 await self.session.cleanup()
                 self.logger.info("Session cleaned up")
             except Exception as e:
                 self.logger.error(f"Cleanup error: {e}", exc_info=True)
+            
+            # A cleaned-up session has nothing left worth saving
+            self.session = None
         
+        self._stop_log_listener()
         return {"status": "shutdown"}
+    
+    # -------------------------------------------------------------------------
+    # Session persistence
+    # -------------------------------------------------------------------------
+    
+    def _history_path(self) -> Path | None:
+        """Get the history database for the current workspace, if enabled."""
+        if not self.config.sessions_dir or not self.workspace_root:
+            return None
+        digest = hashlib.blake2b(self.workspace_root.encode("utf-8"), digest_size=8).hexdigest()
+        return self.config.sessions_dir / f"{digest}.sqlite"
+    
+    def _get_context(self) -> Any:
+        """Get the session's context manager, if it supports history access."""
+        coordinator = getattr(self.session, "coordinator", None)
+        context = coordinator.get("context") if coordinator else None
+        if context is None or not hasattr(context, "get_messages") or not hasattr(context, "set_messages"):
+            return None
+        return context
+    
+    async def _restore_history(self) -> None:
+        """Load saved conversation history into the new session."""
+        path = self._history_path()
+        context = self._get_context()
+        if path is None or context is None or not path.exists():
+            return
+        
+        try:
+            messages = await asyncio.to_thread(_read_history, path)
+        except (sqlite3.Error, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable session history {path}: {e}")
+            return
+        
+        if not messages:
+            return
+        
+        try:
+            await context.set_messages(messages)
+        except Exception as e:
+            # Start fresh rather than failing every initialize on this file
+            self.logger.warning(f"Ignoring incompatible session history {path}: {e}")
+            return
+        self.logger.info(f"Restored {len(messages)} messages from {path}")
+    
+    async def save_history(self) -> None:
+        """Save the session's conversation history for the next bridge.
+        
+        Failures are logged rather than raised.
+        """
+        path = self._history_path()
+        if path is None:
+            return
+        
+        try:
+            context = self._get_context()
+            if context is None:
+                return
+            messages = await context.get_messages()
+            await asyncio.to_thread(_write_history, path, messages)
+        except Exception as e:
+            self.logger.error(f"Failed to save session history: {e}", exc_info=True)
+            return
+        self.logger.info(f"Saved {len(messages)} messages to {path}")
+
+
+def _read_history(path: Path) -> list[dict[str, Any]]:
+    """Read saved messages from a history database."""
+    with closing(sqlite3.connect(path)) as db:
+        rows = db.execute("SELECT content FROM history ORDER BY turn_id").fetchall()
+    return [decode_message(content) for (content,) in rows]
+
+
+def _write_history(path: Path, messages: list[dict[str, Any]]) -> None:
+    """Replace the contents of a history database with the given messages."""
+    # Conversations are private to the user, so keep them unreadable to others
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    now = time.time()
+    
+    with closing(sqlite3.connect(path)) as db, db:
+        os.chmod(path, 0o600)
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS history ("
+            "turn_id INTEGER PRIMARY KEY, role TEXT, content BLOB, ts REAL)"
+        )
+        db.execute("DELETE FROM history")
+        db.executemany(
+            "INSERT INTO history (role, content, ts) VALUES (?, ?, ?)",
+            [(message.get("role"), encode_json(message), now) for message in messages],
+        )
+
+
+# =============================================================================
+# Stdio Channel
+# =============================================================================
+
+if orjson is not None:
+    encode_json = orjson.dumps
+    decode_message = orjson.loads
+else:
+    def encode_json(obj: Any) -> bytes:
+        """Serialize an object to UTF-8 JSON bytes."""
+        return json.dumps(obj).encode("utf-8")
+    
+    decode_message = json.loads
+
+# Streamed chunks and the completion marker have a fixed shape, so only the
+# chunk text is serialized; the rest is spliced in from these templates
+CHUNK_PREFIX = b'{"type":"chunk","content":'
+CHUNK_SUFFIX = b'}'
+DONE_MESSAGE = b'{"type":"done"}'
+
+
+class StdioChannel:
+    """Non-blocking stdin/stdout channel for the bridge protocol.
+    
+    Reads and writes go through asyncio pipe transports so a slow VSCode
+    reader (or a quiet stdin) never stalls the event loop while a prompt
+    is executing. Where pipe transports are unavailable (e.g. the Windows
+    proactor loop with console handles), stdin is read on a helper thread
+    and stdout is written synchronously.
+    
+    Messages sent with flush=False are buffered and written together once
+    OUTPUT_FLUSH_BYTES accumulate or OUTPUT_FLUSH_INTERVAL elapses, so a
+    chatty stream costs a handful of writes rather than one per chunk.
+    
+    Messages are newline-delimited JSON unless the channel is opened with
+    framed=True, in which case each one is a 4-byte little-endian payload
+    length followed by the JSON payload. Responses use the same framing as
+    requests.
+    """
+    
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter | None,
+        stdout: BinaryIO,
+        framed: bool = False,
+    ):
+        self._loop = loop
+        self._reader = reader
+        self._writer = writer
+        self._stdout = stdout
+        self._write = writer.write if writer is not None else self._write_stdout
+        self._buffer = bytearray()
+        self._flush_timer: asyncio.TimerHandle | None = None
+        self._framed = framed
+    
+    @classmethod
+    async def open(
+        cls, loop: asyncio.AbstractEventLoop, stdout: BinaryIO, framed: bool = False
+    ) -> "StdioChannel":
+        """Connect asyncio streams to the process stdin and the given stdout.
+        
+        Args:
+            loop: The running event loop
+            stdout: Binary stream the protocol output is written to
+            framed: Use length-prefixed frames instead of JSON lines
+        """
+        reader = asyncio.StreamReader(limit=MAX_MESSAGE_BYTES)
+        
+        try:
+            if not cls._is_pipe(sys.stdin):
+                raise ValueError("stdin is not a pipe")
+            await loop.connect_read_pipe(
+                lambda: asyncio.StreamReaderProtocol(reader), sys.stdin
+            )
+        except (NotImplementedError, OSError, ValueError):
+            threading.Thread(
+                target=cls._pump_stdin, args=(loop, reader), daemon=True
+            ).start()
+        
+        try:
+            if not cls._is_pipe(stdout):
+                raise ValueError("stdout is not a pipe")
+            transport, protocol = await loop.connect_write_pipe(
+                asyncio.streams.FlowControlMixin, stdout
+            )
+            writer = asyncio.StreamWriter(transport, protocol, None, loop)
+        except (NotImplementedError, OSError, ValueError):
+            writer = None
+        
+        return cls(loop, reader, writer, stdout, framed)
+    
+    @staticmethod
+    def _is_pipe(stream: Any) -> bool:
+        """Check whether a stream is a pipe or socket.
+        
+        uvloop aborts the process when given a regular file, so only these
+        are attached to pipe transports.
+        """
+        try:
+            mode = os.fstat(stream.fileno()).st_mode
+        except (AttributeError, OSError, ValueError):
+            return False
+        return stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode)
+    
+    @staticmethod
+    def _pump_stdin(loop: asyncio.AbstractEventLoop, reader: asyncio.StreamReader) -> None:
+        """Feed stdin into the reader from a background thread.
+        
+        Reads whatever is available rather than whole lines, since
+        length-prefixed frames carry no newline.
+        """
+        for data in iter(lambda: sys.stdin.buffer.read1(65536), b""):
+            loop.call_soon_threadsafe(reader.feed_data, data)
+        loop.call_soon_threadsafe(reader.feed_eof)
+    
+    async def read_message(self) -> bytes:
+        """Read the next command's JSON payload; returns b"" on EOF.
+        
+        Raises:
+            ValueError: The message exceeded MAX_MESSAGE_BYTES; it has been
+                discarded and the next read starts at the following message.
+        """
+        try:
+            if not self._framed:
+                return await self._read_line()
+            
+            header = await self._reader.readexactly(4)
+            size = int.from_bytes(header, "little")
+            if size > MAX_MESSAGE_BYTES:
+                await self._discard(size)
+                raise ValueError(f"Frame too large: {size} bytes (limit {MAX_MESSAGE_BYTES})")
+            return await self._reader.readexactly(size)
+        except asyncio.IncompleteReadError:
+            return b""  # EOF, possibly mid-frame
+    
+    async def _read_line(self) -> bytes:
+        """Read up to and including the next newline, within the size limit."""
+        try:
+            return await self._reader.readuntil(b"\n")
+        except asyncio.IncompleteReadError as e:
+            return e.partial  # Last line without a newline
+        except asyncio.LimitOverrunError:
+            pass
+        
+        # Drop the rest of the oversized line so the next read is in sync
+        while True:
+            try:
+                await self._reader.readuntil(b"\n")
+                break
+            except asyncio.LimitOverrunError as e:
+                await self._reader.readexactly(e.consumed)
+            except asyncio.IncompleteReadError:
+                break
+        raise ValueError(f"Frame too large: exceeds {MAX_MESSAGE_BYTES} bytes")
+    
+    async def _discard(self, size: int) -> None:
+        """Skip the given number of bytes of input."""
+        while size > 0:
+            chunk = await self._reader.read(min(size, MAX_MESSAGE_BYTES))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b"", size)
+            size -= len(chunk)
+    
+    async def send(self, message: dict[str, Any], *, flush: bool = True) -> None:
+        """Write one JSON message.
+        
+        Args:
+            message: Protocol message to send
+            flush: Write immediately; otherwise the message may be batched
+        """
+        await self._append(encode_json(message), flush=flush)
+    
+    async def send_chunk(self, content: str) -> None:
+        """Write a streamed {"type": "chunk"} message, batched."""
+        await self._append(CHUNK_PREFIX, encode_json(content), CHUNK_SUFFIX, flush=False)
+    
+    async def send_done(self) -> None:
+        """Write the {"type": "done"} completion marker and flush."""
+        await self._append(DONE_MESSAGE, flush=True)
+    
+    async def _append(self, *parts: bytes, flush: bool) -> None:
+        """Buffer one message made of the given JSON fragments."""
+        if self._framed:
+            size = sum(len(part) for part in parts)
+            self._buffer += size.to_bytes(4, "little")
+        for part in parts:
+            self._buffer += part
+        if not self._framed:
+            self._buffer += b"\n"
+        
+        if flush or len(self._buffer) >= OUTPUT_FLUSH_BYTES:
+            await self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = self._loop.call_later(
+                OUTPUT_FLUSH_INTERVAL, self._write_buffer
+            )
+    
+    async def flush(self) -> None:
+        """Write any buffered messages and wait for the pipe to drain."""
+        self._write_buffer()
+        if self._writer is not None:
+            await self._writer.drain()
+    
+    def _write_buffer(self) -> None:
+        """Hand buffered output to stdout without waiting."""
+        if self._flush_timer is not None:
+            self._flush_timer.cancel()
+            self._flush_timer = None
+        
+        if not self._buffer:
+            return
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        self._write(data)
+    
+    def _write_stdout(self, data: bytes) -> None:
+        """Write to stdout synchronously (no pipe transport available)."""
+        self._stdout.write(data)
+        self._stdout.flush()
 
 
 # =============================================================================
@@ -216,72 +787,126 @@ async def main():
     """Main stdin/stdout communication loop.
     
     Protocol:
-    - Reads JSON commands from stdin (one per line)
-    - Writes JSON responses to stdout (one per line)
-    - Supports: initialize, execute, shutdown commands
+    - Reads JSON commands from stdin (one per line, or length-prefixed)
+    - Writes JSON responses to stdout in the same framing
+    - Supports: initialize, execute, cancel, shutdown commands
+    
+    Prompts run in the background so a cancel can be read while one is
+    executing; any other command waits for the running prompt first.
     """
     config = BridgeConfig.from_env()
     bridge = VSCodeAmplifierBridge(config)
     
+    # Look the loop up once; the bridge and channel schedule work on it
+    loop = asyncio.get_running_loop()
+    bridge.loop = loop
+    
+    # stdout belongs to the channel; stray output would corrupt the JSON
+    # protocol. Point fd 1 itself at stderr, so child processes, C
+    # extensions and saved sys.stdout references are caught too, and give
+    # the channel a private duplicate of the real stdout
+    sys.stdout.flush()
+    protocol_out = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    sys.stdout = sys.stderr
+    channel = await StdioChannel.open(loop, protocol_out, config.length_prefixed)
+    
+    # Only start loading once stray prints can no longer reach the protocol
+    bridge.preheat()
+    
+    async def send_error(error: str) -> None:
+        # Keep errors out of the middle of a running prompt's responses
+        await bridge.wait_prompt()
+        await channel.send({"type": "error", "error": error})
+    
+    # Command handlers return True when the loop should exit
+    async def do_initialize(request: dict[str, Any]) -> bool:
+        await bridge.wait_prompt()
+        
+        # Initialize session with workspace
+        result = await bridge.initialize(
+            request.get("workspace_root", ""),
+            request.get("bundle_path")
+        )
+        await channel.send(result)
+        return False
+    
+    async def do_execute(request: dict[str, Any]) -> bool:
+        await bridge.wait_prompt()
+        
+        # Execute prompt on persistent session, streaming responses back
+        await bridge.start_prompt(request.get("prompt", ""), channel)
+        return False
+    
+    async def do_cancel(request: dict[str, Any]) -> bool:
+        # Abort the running prompt; it reports "cancelled" and "done" itself
+        await bridge.cancel_prompt()
+        return False
+    
+    async def do_shutdown(request: dict[str, Any]) -> bool:
+        # Graceful shutdown (cancels any running prompt)
+        result = await bridge.shutdown()
+        await channel.send(result)
+        return True
+    
+    handlers: dict[str, Callable[[dict[str, Any]], Awaitable[bool]]] = {
+        "initialize": do_initialize,
+        "execute": do_execute,
+        "cancel": do_cancel,
+        "shutdown": do_shutdown,
+    }
+    
     # Main command loop
+    request_count = 0
     while True:
         try:
             # Read command from stdin
-            line = sys.stdin.readline()
-            if not line:
+            payload = await channel.read_message()
+            if not payload:
                 break  # EOF
             
-            request = json.loads(line.strip())
+            request_count += 1
+            REQUEST_ID.set(f"req{request_count}")
+            
+            request = decode_message(payload)
             command = request.get("command")
             
-            if command == "initialize":
-                # Initialize session with workspace
-                result = await bridge.initialize(
-                    request.get("workspace_root", ""),
-                    request.get("bundle_path")
-                )
-                print(json.dumps(result), flush=True)
-                
-            elif command == "execute":
-                # Execute prompt on persistent session
-                prompt = request.get("prompt", "")
-                
-                # Stream responses back
-                async for chunk in bridge.execute_prompt(prompt):
-                    print(json.dumps(chunk), flush=True)
-                
-                # Send completion marker
-                print(json.dumps({"type": "done"}), flush=True)
-                
-            elif command == "shutdown":
-                # Graceful shutdown
-                result = await bridge.shutdown()
-                print(json.dumps(result), flush=True)
-                break  # Exit loop
-                
-            else:
+            handler = handlers.get(command)
+            if handler is None:
                 # Unknown command
-                error_response = {
-                    "type": "error",
-                    "error": f"Unknown command: {command}"
-                }
-                print(json.dumps(error_response), flush=True)
+                await send_error(f"Unknown command: {command}")
+            elif await handler(request):
+                break  # Exit loop
                 
-        except json.JSONDecodeError as e:
-            error_response = {
-                "type": "error",
-                "error": f"Invalid JSON: {e}"
-            }
-            print(json.dumps(error_response), flush=True)
+        except json.JSONDecodeError as e:  # orjson's error subclasses this
+            await send_error(f"Invalid JSON: {e}")
+            
+        except ConnectionError:
+            break  # VSCode closed our stdout
             
         except Exception as e:
-            error_response = {
-                "type": "error",
-                "error": str(e)
-            }
-            print(json.dumps(error_response), flush=True)
+            await send_error(str(e))
+    
+    # Let a prompt still running at EOF finish writing its responses, and
+    # keep the conversation for the next bridge even without a shutdown
+    await bridge.wait_prompt()
+    if bridge.session:
+        await bridge.save_history()
 
 
 if __name__ == "__main__":
+    # Use libuv's event loop when available (not on Windows)
+    try:
+        import uvloop
+    except ImportError:
+        uvloop = None
+    
     # Run the bridge service
-    asyncio.run(main())
+    if uvloop is None:
+        asyncio.run(main())
+    elif sys.version_info >= (3, 12):
+        asyncio.run(main(), loop_factory=uvloop.new_event_loop)
+    else:
+        # Older interpreters only accept the loop through the policy API
+        uvloop.install()
+        asyncio.run(main())
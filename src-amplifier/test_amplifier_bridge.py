@@ -0,0 +1,188 @@
+"""
+Tests for the bridge's stdio framing and size limits.
+
+Run from this directory with: python -m unittest
+"""
+import asyncio
+import io
+import json
+import unittest
+
+from amplifier_bridge import (
+    MAX_MESSAGE_BYTES,
+    MAX_PROMPT_CHARS,
+    BridgeConfig,
+    StdioChannel,
+    VSCodeAmplifierBridge,
+)
+
+
+def frame(payload: bytes) -> bytes:
+    """Prefix a payload with its 4-byte little-endian length."""
+    return len(payload).to_bytes(4, "little") + payload
+
+
+class ChannelTestCase(unittest.IsolatedAsyncioTestCase):
+    """Drives a StdioChannel through a StreamReader fed by the test."""
+
+    framed = False
+
+    async def asyncSetUp(self):
+        self.reader = asyncio.StreamReader(limit=MAX_MESSAGE_BYTES)
+        self.stdout = io.BytesIO()
+        self.channel = StdioChannel(
+            asyncio.get_running_loop(), self.reader, None, self.stdout, self.framed
+        )
+
+    def feed(self, *parts: bytes, eof: bool = True) -> None:
+        for part in parts:
+            self.reader.feed_data(part)
+        if eof:
+            self.reader.feed_eof()
+
+    async def feed_slowly(self, data: bytes, size: int = 65536) -> None:
+        """Feed data in pipe-sized pieces while the channel reads."""
+        for start in range(0, len(data), size):
+            self.reader.feed_data(data[start:start + size])
+            await asyncio.sleep(0)
+        self.reader.feed_eof()
+
+
+class LineFramingTests(ChannelTestCase):
+
+    async def test_reads_lines_in_order(self):
+        self.feed(b'{"command":"a"}\n{"command":"b"}\n')
+        self.assertEqual(await self.channel.read_message(), b'{"command":"a"}\n')
+        self.assertEqual(await self.channel.read_message(), b'{"command":"b"}\n')
+        self.assertEqual(await self.channel.read_message(), b"")
+
+    async def test_last_line_without_newline(self):
+        self.feed(b'{"command":"a"}')
+        self.assertEqual(await self.channel.read_message(), b'{"command":"a"}')
+        self.assertEqual(await self.channel.read_message(), b"")
+
+    async def test_leading_whitespace_stays_line_framed(self):
+        self.feed(b' {"command":"a"}\n')
+        self.assertEqual(await self.channel.read_message(), b' {"command":"a"}\n')
+
+    async def test_oversized_line_is_skipped(self):
+        self.feed(b"x" * (MAX_MESSAGE_BYTES + 1) + b"\n", b'{"command":"a"}\n')
+        with self.assertRaises(ValueError):
+            await self.channel.read_message()
+        self.assertEqual(await self.channel.read_message(), b'{"command":"a"}\n')
+
+    async def test_oversized_line_arriving_in_pieces_is_skipped(self):
+        data = b"x" * (2 * MAX_MESSAGE_BYTES) + b"\n" + b'{"command":"a"}\n'
+        feeding = asyncio.create_task(self.feed_slowly(data))
+        with self.assertRaises(ValueError):
+            await self.channel.read_message()
+        self.assertEqual(await self.channel.read_message(), b'{"command":"a"}\n')
+        await feeding
+
+    async def test_oversized_line_at_eof(self):
+        self.feed(b"x" * (MAX_MESSAGE_BYTES + 1))
+        with self.assertRaises(ValueError):
+            await self.channel.read_message()
+        self.assertEqual(await self.channel.read_message(), b"")
+
+    async def test_send_writes_json_lines(self):
+        await self.channel.send({"status": "ok"})
+        await self.channel.send_chunk("hi")
+        await self.channel.send_done()
+        lines = self.stdout.getvalue().splitlines()
+        self.assertEqual(
+            [json.loads(line) for line in lines],
+            [{"status": "ok"}, {"type": "chunk", "content": "hi"}, {"type": "done"}],
+        )
+
+
+class LengthPrefixedFramingTests(ChannelTestCase):
+
+    framed = True
+
+    async def test_reads_frames_in_order(self):
+        self.feed(frame(b'{"command":"a"}'), frame(b'{"command":"b"}'))
+        self.assertEqual(await self.channel.read_message(), b'{"command":"a"}')
+        self.assertEqual(await self.channel.read_message(), b'{"command":"b"}')
+        self.assertEqual(await self.channel.read_message(), b"")
+
+    async def test_lengths_that_look_like_json_text(self):
+        # Low length bytes of "{", BOM and whitespace must not be special
+        for size in (0x09, 0x0A, 0x0D, 0x20, 0x7B, 0xEF):
+            with self.subTest(size=size):
+                payload = b'{"command":"a"}'.ljust(size)
+                self.feed(frame(payload), frame(b"{}"), eof=False)
+                self.assertEqual(await self.channel.read_message(), payload)
+                self.assertEqual(await self.channel.read_message(), b"{}")
+
+    async def test_oversized_frame_is_skipped(self):
+        self.feed(frame(b" " * (MAX_MESSAGE_BYTES + 1)), frame(b'{"command":"a"}'))
+        with self.assertRaises(ValueError):
+            await self.channel.read_message()
+        self.assertEqual(await self.channel.read_message(), b'{"command":"a"}')
+
+    async def test_oversized_frame_arriving_in_pieces_is_skipped(self):
+        data = frame(b" " * (2 * MAX_MESSAGE_BYTES)) + frame(b'{"command":"a"}')
+        feeding = asyncio.create_task(self.feed_slowly(data))
+        with self.assertRaises(ValueError):
+            await self.channel.read_message()
+        self.assertEqual(await self.channel.read_message(), b'{"command":"a"}')
+        await feeding
+
+    async def test_eof_in_header(self):
+        self.feed(b"\x10\x00")
+        self.assertEqual(await self.channel.read_message(), b"")
+
+    async def test_eof_in_payload(self):
+        self.feed(frame(b'{"command":"a"}')[:-3])
+        self.assertEqual(await self.channel.read_message(), b"")
+
+    async def test_eof_in_oversized_frame(self):
+        self.feed((MAX_MESSAGE_BYTES + 1).to_bytes(4, "little"), b" " * 100)
+        self.assertEqual(await self.channel.read_message(), b"")
+
+    async def test_send_writes_frames(self):
+        await self.channel.send_chunk("hi")
+        await self.channel.send_done()
+        out = self.stdout.getvalue()
+        messages = []
+        while out:
+            size = int.from_bytes(out[:4], "little")
+            messages.append(json.loads(out[4:4 + size]))
+            out = out[4 + size:]
+        self.assertEqual(messages, [{"type": "chunk", "content": "hi"}, {"type": "done"}])
+
+
+class PromptLimitTests(unittest.IsolatedAsyncioTestCase):
+
+    class EchoSession:
+        async def execute(self, prompt):
+            return prompt
+
+    async def asyncSetUp(self):
+        self.bridge = VSCodeAmplifierBridge(BridgeConfig())
+        self.bridge.session = self.EchoSession()
+
+    async def run_prompt(self, prompt):
+        return [chunk async for chunk in self.bridge.execute_prompt(prompt)]
+
+    async def test_prompt_at_limit_runs(self):
+        prompt = "x" * MAX_PROMPT_CHARS
+        self.assertEqual(await self.run_prompt(prompt), [{"type": "response", "content": prompt}])
+
+    async def test_prompt_over_limit_is_rejected(self):
+        [result] = await self.run_prompt("x" * (MAX_PROMPT_CHARS + 1))
+        self.assertEqual(result["type"], "error")
+        self.assertIn("Prompt too long", result["error"])
+
+    async def test_non_string_prompt_is_rejected(self):
+        for prompt in (None, 5):
+            with self.subTest(prompt=prompt):
+                self.assertEqual(
+                    await self.run_prompt(prompt),
+                    [{"type": "error", "error": "Prompt must be a string"}],
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,7 @@ export class AmplifierChatProvider implements vscode.LanguageModelChatProvider {
     private isInitialized = false;
     private pendingResponses = new Map<string, (value: any) => void>();
     private responseBuffer = '';
+    private cancelledPrompts = 0;  // Cancelled executions whose 'done' is still pending
     private pythonPath?: string;  // Cached Python path
     public context?: vscode.ExtensionContext;  // Set by extension.ts
     
@@ -198,7 +199,9 @@ export class AmplifierChatProvider implements vscode.LanguageModelChatProvider {
         
         const env: NodeJS.ProcessEnv = {
             ...process.env,
-            PYTHONUNBUFFERED: '1'
+            PYTHONUNBUFFERED: '1',
+            // Lets the bridge start preparing the bundle before initialize arrives
+            AMPLIFIER_BUNDLE_PATH: path.join(this.context.extensionPath, 'src-amplifier', 'amplifier_bundle.yaml')
         };
         
         // Add the API key to environment
@@ -220,14 +223,14 @@ export class AmplifierChatProvider implements vscode.LanguageModelChatProvider {
                 'AZURE_OPENAI_ENDPOINT'
             ].filter(key => env[key]);  // Only include vars that exist in our env
             
-            if (wslEnvVars.length > 0) {
-                env['WSLENV'] = wslEnvVars.join('/u:') + '/u';  // /u flag passes variables as-is
-            }
+            // /u flag passes variables as-is; /p translates a Windows path to its WSL form
+            env['WSLENV'] = [...wslEnvVars.map(key => `${key}/u`), 'AMPLIFIER_BUNDLE_PATH/p'].join(':');
         }
         
         const proc = spawn(command, args, {
             stdio: ['pipe', 'pipe', 'pipe'],
             shell: command !== 'wsl',  // Only use shell for non-WSL commands
+            cwd: this.getWorkspaceRoot(),  // Tools resolve relative paths from the workspace
             env
         });
         
@@ -258,6 +261,7 @@ export class AmplifierChatProvider implements vscode.LanguageModelChatProvider {
             console.log(`[Bridge closed] Exit code: ${code}`);
             this.bridgeProcess = undefined;
             this.isInitialized = false;
+            this.cancelledPrompts = 0;
         });
     }
 
@@ -281,6 +285,14 @@ export class AmplifierChatProvider implements vscode.LanguageModelChatProvider {
                 const response = JSON.parse(line);
                 console.log('[Bridge response]:', response);
                 
+                // Drop leftover output from cancelled executions
+                if (this.cancelledPrompts > 0) {
+                    if (response.type === 'done') {
+                        this.cancelledPrompts--;
+                    }
+                    continue;
+                }
+                
                 // Resolve pending promise if exists
                 const resolver = this.pendingResponses.get('current');
                 if (resolver) {
@@ -352,6 +364,7 @@ export class AmplifierChatProvider implements vscode.LanguageModelChatProvider {
     ): Promise<void> {
         return new Promise((resolve, reject) => {
             let hasReceivedResponse = false;
+            let isFinished = false;
             
             const timeout = setTimeout(() => {
                 if (!hasReceivedResponse) {
@@ -361,8 +374,18 @@ export class AmplifierChatProvider implements vscode.LanguageModelChatProvider {
             
             // Handle cancellation
             token.onCancellationRequested(() => {
+                if (isFinished) {
+                    return;
+                }
+                isFinished = true;
                 clearTimeout(timeout);
                 this.pendingResponses.delete('current');
+                
+                // Stop the bridge from generating; it still ends with 'done'
+                if (this.bridgeProcess?.stdin) {
+                    this.cancelledPrompts++;
+                    this.bridgeProcess.stdin.write(JSON.stringify({ command: 'cancel' }) + '\n');
+                }
                 reject(new Error('Request cancelled by user'));
             });
             
@@ -374,11 +397,20 @@ export class AmplifierChatProvider implements vscode.LanguageModelChatProvider {
                     if (cleaned.trim()) {
                         progress.report(new vscode.LanguageModelTextPart(cleaned));
                     }
+                } else if (response.type === 'chunk') {
+                    hasReceivedResponse = true;
+                    // Streamed pieces can split lines, so only strip ANSI codes
+                    const text = response.content.replace(/\x1b\[[0-9;]*m/g, '');
+                    if (text) {
+                        progress.report(new vscode.LanguageModelTextPart(text));
+                    }
                 } else if (response.type === 'error') {
+                    isFinished = true;
                     clearTimeout(timeout);
                     this.pendingResponses.delete('current');
                     reject(new Error(response.error));
                 } else if (response.type === 'done') {
+                    isFinished = true;
                     clearTimeout(timeout);
                     this.pendingResponses.delete('current');
                     resolve();